@@ -20,4 +20,8 @@ __license__ = "BSD"
 
 from .api import API_URI_STUB, RESOURCE_ENDPOINTS, RESOURCE_TYPES
 from .api import ApiController, ApiResourceList
-from .wrappers import Pokemon
+from .api import CacheRefresher, REFRESH_WORKER
+from .assets import AssetStore
+from .cache import CacheBackend, JsonFileCache, LayeredCache, MemoryCache
+from .cache import RedisCache
+from .wrappers import ApiResource, Pokemon, RESOURCE_CLASSES
@@ -14,10 +14,15 @@ the outer directory.
 
 # TODO add custom limit, offset fields to API queries
 
-import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
+from .cache import JsonFileCache
+
 
 API_URI_STUB = "https://pokeapi.co/api/v2"
 
@@ -93,11 +98,84 @@ finally:
         RESOURCE_ENDPOINTS = RESOURCE_TYPES
 
 
+class CacheRefresher:
+    """A small background worker pool that refreshes expired cache
+    entries off the request path.
+
+    Concurrency is bounded by max_workers, and a url that already has
+    a refresh queued or running for the same cache is not queued
+    a second time.
+    """
+    def __init__(self, max_workers=4):
+        """Instantiates the refresher. Worker threads are only started
+        once the first refresh gets submitted.
+        """
+        self.max_workers = max_workers
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="pokewrap-refresh"
+        )
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _run(self, key, url, refresh):
+        """Calls refresh(url), then clears its key from the pending jobs
+        so later expirations can queue it again.
+        """
+        try:
+            return refresh(url)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def shutdown(self, wait=True):
+        """Stops accepting refreshes and, if wait is True, blocks until
+        every queued refresh has finished.
+        """
+        self._executor.shutdown(wait=wait)
+
+    def submit(self, url, refresh, scope=None):
+        """Queues refresh(url) on the worker pool and returns its Future.
+
+        If a refresh for url in the same [scope] (normally the cache
+        being refreshed) is already pending, the existing Future is
+        returned instead of queueing a duplicate job.
+
+        Raises RuntimeError once the refresher has been shut down.
+        """
+        key = (scope, url)
+
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(self._run, key, url, refresh)
+                self._pending[key] = future
+
+        return future
+
+    def wait(self, timeout=None):
+        """Blocks until every refresh pending at call time has finished."""
+        with self._lock:
+            futures = list(self._pending.values())
+
+        for future in futures:
+            future.result(timeout=timeout)
+
+
+# Shared by every ApiController that doesn't bring its own refresher
+REFRESH_WORKER = CacheRefresher()
+
+
 class ApiController:
     """An object that manages the connection between PokeAPI
     (https://pokeapi.co/) and the running application.
     """
-    def __init__(self, resource, name_or_id):
+    def __init__(self, resource, name_or_id, cache_ttl=None,
+                 serve_stale=False, refresher=None, cache=None):
         """Initializes the ApiController with default uri
         to enable HTTP requests to the API source.
 
@@ -107,9 +185,26 @@ class ApiController:
         To retrieve content on a specific pokemon, for instance,
         use resource='pokemon' and name_or_id='gengar' for name,
         or name_or_id=94 for pokemon ID number.
+
+        Optionally takes a [cache_ttl] in seconds after which cached
+        entries count as expired (None keeps them forever), and
+        [serve_stale], which returns expired entries right away while a
+        [refresher] (REFRESH_WORKER by default) updates them in the
+        background.
+
+        Data is cached in a cache.json file in the cwd unless another
+        backend from the cache module is passed as [cache].
         """
         self.content_dict = {}
+        self.cached_at = {}
         self.cache_path = self._build_cache_path()
+        self.cache = JsonFileCache(self.cache_path) if cache is None else cache
+
+        self._unsaved = set()
+
+        self.cache_ttl = cache_ttl
+        self.serve_stale = serve_stale
+        self.refresher = REFRESH_WORKER if refresher is None else refresher
 
         self.endpoint = API_URI_STUB
 
@@ -167,10 +262,12 @@ class ApiController:
             url = self.url
         try:
             api_response = requests.get(url, timeout=timeout)
-            response.raise_for_status()
+            api_response.raise_for_status()
 
             self.content_dict[url] = api_response.json()
-            return {url: api_response.json()}
+            self.cached_at[url] = time.time()
+            self._unsaved.add(url)
+            return {url: self.content_dict[url]}
         except requests.exceptions.HTTPError as error_h:
             print(error_h)
         except requests.exceptions.ConnectionError as error_c:
@@ -182,6 +279,26 @@ class ApiController:
 
         return {url: None}
 
+    def _is_expired(self, url):
+        """Checks whether the held entry for url is older than
+        self.cache_ttl. Entries without a recorded fetch time count as
+        expired once a ttl is set.
+        """
+        if self.cache_ttl is None:
+            return False
+
+        return time.time() - self.cached_at.get(url, 0) > self.cache_ttl
+
+    def _refresh_resource(self, url):
+        """Re-downloads url and writes it back into the cache.
+        Runs on the refresher's worker threads.
+        """
+        data = self._get_resource(url)
+        if data[url] is not None:
+            self.cache_save()
+
+        return data
+
     def _validate_resource(self, resource):
         """Checks if the endpoint is a valid API endpoint within PokeAPI.
         Raises error if endpoint not in the list of valid resource types.
@@ -191,47 +308,37 @@ class ApiController:
 
         return resource
 
-    def cache_load(self):
-        """Loads the given data from the cache, if applicable.
-        Handles errors that could be thrown based on the possible
-        states the cache can exist in (doesn't exist, open, etc.).
+    def cache_load(self, urls=None):
+        """Loads the entries for urls (every url held in
+        self.content_dict by default) from self.cache into
+        self.content_dict, returning a dict of the urls found
+        mapped to their data.
         """
+        if urls is None:
+            urls = list(self.content_dict)
+
         file_data = {}
 
-        try:
-            with open(self.cache_path, "r", encoding="utf-8") as file:
-                file_data = json.load(file)
-        except FileNotFoundError:
-            pass
-        except OSError as error:
-            # Check if cache file is already open
-            if error.errno == 11:
-                pass
-            else:
-                raise error
+        for (url, (data, cached_at)) in self.cache.get_many(urls).items():
+            self.content_dict[url] = data
+            self.cached_at[url] = cached_at
+            file_data[url] = data
 
         return file_data
 
     def cache_save(self):
-        """Saves all held information into the cache if an identical
-        cache entry doesn't already exist.
+        """Saves all information retrieved from the API since the last
+        save into self.cache. Entries fetched more recently than the
+        cached copy replace it.
         """
-        file_data = self.cache_load()
+        urls = [url for url in list(self._unsaved)
+                if self.content_dict.get(url) is not None]
+        self._unsaved.difference_update(urls)
 
-        try:
-            for (key, value) in self.content_dict.items():
-                if value is not None and key not in file_data.keys():
-                    file_data[key] = value
-
-            with open(self.cache_path, "w", encoding="utf-8") as file:
-                file.seek(0)
-                json.dump(file_data, file)
-        except OSError as error:
-            # Cache already open
-            if error.errno == 11:
-                raise KeyError("Cache could not be opened.") from error
-            else:
-                raise
+        if urls:
+            self.cache.set_many({url: (self.content_dict[url],
+                                       self.cached_at.get(url, 0))
+                                 for url in urls})
 
     def convert_name_or_id(self, endpoint, resource, name_or_id):
         """Converts a name to an ID or an ID to a name,
@@ -257,25 +364,60 @@ class ApiController:
 
         return name, id_
 
-    def get_data(self, url=None):
+    def get_data(self, url=None, serve_stale=None):
         """Tries to retrieve data from the cache in case it already exists.
         Then calls _get_resource() to send GET request to API otherwise.
 
+        Expired entries are re-fetched before returning, unless
+        [serve_stale] (defaulting to self.serve_stale) is set, in which
+        case the cached entry is returned right away and a refresh is
+        queued on self.refresher.
+
         Retrieved data gets saved to self.content_dict with url as key.
         """
         if url is None:
             url = self.url
 
-        data = self.cache_load()
+        return self.get_data_many([url], serve_stale)
 
-        if url in data.keys():
-            self.content_dict[url] = data[url]
-            return {url: data[url]}
+    def get_data_many(self, urls, serve_stale=None):
+        """Works like get_data() for several urls at once, looking them
+        all up in the cache with a single batched request.
 
-        data = self._get_resource(url)
-        self.cache_save()
+        Returns a dict of each url mapped to its data.
+        """
+        if serve_stale is None:
+            serve_stale = self.serve_stale
+
+        data = {}
+        stale = {}
+
+        for (url, cached) in self.cache_load(urls).items():
+            if not self._is_expired(url):
+                data[url] = cached
+            elif serve_stale:
+                try:
+                    self.refresher.submit(url, self._refresh_resource,
+                                          scope=self.cache)
+                except RuntimeError as error:
+                    # Refresher shut down, the stale copy is still usable
+                    print(error)
+                data[url] = cached
+            else:
+                stale[url] = cached
 
-        return data
+        missing = [url for url in dict.fromkeys(urls) if url not in data]
+
+        for url in missing:
+            fetched = self._get_resource(url)[url]
+
+            # Fall back to the expired copy if the API couldn't be reached
+            data[url] = stale.get(url) if fetched is None else fetched
+
+        if missing:
+            self.cache_save()
+
+        return {url: data[url] for url in urls}
 
     def set_cache(self, new_cache_path=None):
         """Change the cache path to new_cache_path, which can be either
@@ -317,24 +459,35 @@ class ApiResourceList():
     """An object that connects to pokeapi (https://pokeapi.co/)
     in order to catalog resources available to the user.
     """
-    def __init__(self, resource, limit=None, offset=None):
+    def __init__(self, resource, limit=None, offset=None, cache=None,
+                 sync=True):
         """Instantiates an ApiResourceList object containing
         a list of possible resources at the given resource endpoint.
 
         Optionally allows for specification of a [limit] and [offset],
         where limit sets the max number of items returned per page,
         and offset sets the max number of pages queried
+
+        Listings are cached in a cache.json file in the cwd unless
+        another backend from the cache module is passed as [cache].
+        With [sync] set, a cached listing is checked against the API
+        and extended with any resources added since it was cached.
         """
         self.endpoint = "/".join((API_URI_STUB, resource))
         self.cache_path = self._build_cache_path()
+        self.cache = JsonFileCache(self.cache_path) if cache is None else cache
+
+        self.sync = sync
 
-        # Dictionary version of results for caching
+        # Time the listing was fetched, None until it is fetched or loaded
+        self.cached_at = None
+        self._unsaved = False
+
+        # Dictionary version of results for caching, along with
+        # self._results and self.count, set by get_data()
         self.response = self.get_data(limit, offset)
         self.cache_save()
 
-        self._results = [i for i in self.response["results"]]
-        self.count = self.response["count"]
-
     def __iter__(self):
         return iter(self._results)
 
@@ -381,7 +534,7 @@ class ApiResourceList():
 
         try:
             api_response = requests.get(query_url, timeout=timeout)
-            response.raise_for_status()
+            api_response.raise_for_status()
 
             return api_response.json()
         except requests.exceptions.HTTPError as error_h:
@@ -395,61 +548,106 @@ class ApiResourceList():
 
         return {}
 
-    def cache_load(self):
-        """Loads the given data from the cache, if applicable.
-        Handles errors that could be thrown based on the possible
-        states the cache can exist in (doesn't exist, open, etc.).
+    def _mark_unsaved(self):
+        """Flags the listing as changed since it was last cached."""
+        self.cached_at = time.time()
+        self._unsaved = True
+
+    def _sync_listing(self, contents, timeout=10):
+        """Compares the count of a cached listing with the API's through
+        a single-item request, then updates the listing in place.
+
+        When resources were added and the cached listing holds every
+        result, only the missing tail is fetched and appended. If
+        resources were removed, the listing is fetched again at its
+        cached size (every result if it was complete), regardless of
+        the paging the caller asked for.
         """
-        file_data = {}
+        probe = self._get_resource(1, None, timeout)
+        count = probe.get("count")
+        cached_count = contents.get("count", 0)
 
-        try:
-            with open(self.cache_path, "r", encoding="utf-8") as file:
-                file_data = json.load(file)
-        except FileNotFoundError:
-            pass
-        except OSError as error:
-            # Cache already open
-            if error.errno == 11:
-                pass
-            else:
-                raise error
+        if count is None or count == cached_count:
+            return contents
 
-        return file_data
+        results = contents.setdefault("results", [])
+        complete = len(results) >= cached_count
 
-    def cache_save(self):
-        """Saves all held information into the cache if an identical
-        cache entry doesn't already exist.
+        if count < cached_count:
+            fresh = self._get_resource(count if complete else len(results),
+                                       None, timeout)
+            if "results" not in fresh:
+                return contents
+
+            self._mark_unsaved()
+            return fresh
+
+        # Partial listings (fetched with a limit) have no tail to extend
+        if complete:
+            tail = self._get_resource(count - len(results), len(results),
+                                      timeout)
+            if "results" not in tail:
+                return contents
+
+            results.extend(tail["results"])
+            contents["next"] = tail.get("next")
+
+            # A short tail means the listing is still missing resources,
+            # which the next sync picks up
+            count = min(count, len(results))
+
+        contents["count"] = count
+        self._mark_unsaved()
+
+        return contents
+
+    def cache_load(self):
+        """Loads the listing for self.endpoint from self.cache,
+        returning None if it hasn't been cached yet.
         """
-        if self.response is None or self.endpoint is None:
-            return
+        entry = self.cache.get(self.endpoint)
+        if entry is None:
+            return None
 
-        file_data = self.cache_load()
+        contents, self.cached_at = entry
+        return contents
 
-        try:
-            file_data[self.endpoint] = self.response
+    def cache_save(self):
+        """Saves the listing into self.cache if it was retrieved
+        from the API since the last save.
+        """
+        if not self.response or self.endpoint is None or not self._unsaved:
+            return
 
-            with open(self.cache_path, "w", encoding="utf-8") as file:
-                file.seek(0)
-                json.dump(file_data, file)
-        except OSError as error:
-            # Cache already open
-            if error.errno == 11:
-                raise KeyError("Cache could not be opened.") from error
-            else:
-                raise
+        self.cache.set(self.endpoint, self.response, self.cached_at)
+        self._unsaved = False
 
-    def get_data(self, limit, offset, timeout=10):
+    def get_data(self, limit, offset, timeout=10, sync=None):
         """Tries to retrieve data from the cache in case it already exists.
         Then calls _get_resource() to send GET request to API otherwise.
 
+        With [sync] (defaulting to self.sync) set, a cached listing is
+        brought up to date with _sync_listing() before being returned.
+
+        The returned listing also becomes self.response, with its
+        results and count held in self._results and self.count.
+
         Retrieved data gets saved to self.content_dict as dict with url as key.
         """
-        data = self.cache_load()
+        if sync is None:
+            sync = self.sync
 
-        if self.endpoint in data.keys():
-            contents = data[self.endpoint]
-        else:
+        contents = self.cache_load()
+
+        if contents is None:
             contents = self._get_resource(limit, offset, timeout)
+            self._mark_unsaved()
+        elif sync:
+            contents = self._sync_listing(contents, timeout)
+
+        self.response = contents
+        self._results = list(contents.get("results", []))
+        self.count = contents.get("count", 0)
 
         return contents
 
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+"""
+A content-addressed disk cache for binary assets served alongside
+PokeAPI data, such as the sprite images linked from Pokemon payloads.
+
+Every download is streamed to disk in chunks and stored under the
+sha256 digest of its bytes, so identical images are only kept once
+and nothing that has been downloaded before gets downloaded again.
+An index file maps each source url to the digest of its contents.
+
+Fetch a sprite and read its bytes:
+>>> store = AssetStore()
+>>> store.read("https://raw.githubusercontent.com/.../94.png")
+b'\\x89PNG...'
+
+Or map the file into memory instead of copying it:
+>>> store.read("https://raw.githubusercontent.com/.../94.png", use_mmap=True)
+<memory at 0x...>
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Size of each chunk streamed from the network to disk, in bytes
+CHUNK_SIZE = 64 * 1024
+
+
+class AssetStore:
+    """A content-addressed store of binary assets downloaded
+    from urls, backed by a directory on disk.
+    """
+    def __init__(self, cache_dir=None, pool_size=8, chunk_size=CHUNK_SIZE):
+        """Instantiates an AssetStore saving blobs into [cache_dir],
+        which defaults to an 'assets' directory in the cwd.
+
+        [pool_size] sets both the number of pooled connections kept
+        per host and the default number of parallel prefetch downloads,
+        and [chunk_size] the bytes streamed per read from the network.
+        """
+        if cache_dir is None:
+            cache_dir = self._build_cache_dir()
+
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self.pool_size = pool_size
+        self.chunk_size = chunk_size
+
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        self.index = self.index_load()
+
+    def __contains__(self, url):
+        digest = self.index.get(url)
+        return digest is not None and os.path.exists(self.blob_path(digest))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __repr__(self):
+        return f"<AssetStore {self.cache_dir} - {len(self)} assets>"
+
+    def _build_cache_dir(self):
+        """Finds the cwd, then builds the desired path to where
+        all cached assets should be saved.
+        """
+        return os.path.join(os.getcwd(), "assets")
+
+    def _download(self, url, timeout=10):
+        """Streams url to a temporary file in chunks while hashing it,
+        then moves the file to its content address.
+
+        Returns the sha256 hex digest of the contents, or None
+        if the download failed.
+        """
+        digest = None
+        tmp_path = None
+
+        try:
+            with self._session.get(url, stream=True,
+                                   timeout=timeout) as api_response:
+                api_response.raise_for_status()
+
+                self.safe_make_dirs(self.cache_dir)
+                hasher = hashlib.sha256()
+
+                with tempfile.NamedTemporaryFile(dir=self.cache_dir,
+                                                 delete=False) as file:
+                    tmp_path = file.name
+                    for chunk in api_response.iter_content(self.chunk_size):
+                        hasher.update(chunk)
+                        file.write(chunk)
+
+            digest = hasher.hexdigest()
+            blob_path = self.blob_path(digest)
+
+            if not os.path.exists(blob_path):
+                self.safe_make_dirs(os.path.dirname(blob_path))
+                os.replace(tmp_path, blob_path)
+        except requests.exceptions.HTTPError as error_h:
+            print(error_h)
+        except requests.exceptions.ConnectionError as error_c:
+            print(error_c)
+        except requests.exceptions.Timeout as error_t:
+            print(error_t)
+        except requests.exceptions.RequestException as error:
+            print(error)
+        finally:
+            # Leftover when the blob already existed or the download failed
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        return digest
+
+    def _fetch(self, url, timeout=10):
+        """Downloads the asset at url unless it's already stored and
+        records it in the in-memory index, without saving the index.
+
+        Returns a tuple of the digest (None on failure) and whether
+        the index changed.
+        """
+        if url in self:
+            return self.index[url], False
+
+        digest = self._download(url, timeout)
+        if digest is None:
+            return None, False
+
+        with self._lock:
+            self.index[url] = digest
+
+        return digest, True
+
+    def blob_path(self, digest):
+        """Builds the path a blob is stored at, fanned out into
+        subdirectories by the first two characters of its digest.
+        """
+        return os.path.join(self.cache_dir, digest[:2], digest)
+
+    def fetch(self, url, timeout=10):
+        """Makes sure the asset at url is stored on disk, downloading
+        it only if it isn't already, and returns its digest.
+
+        Returns None if the asset could not be downloaded.
+        """
+        digest, added = self._fetch(url, timeout)
+
+        if added:
+            self.index_save()
+
+        return digest
+
+    def index_load(self):
+        """Loads the url to digest index from the cache directory,
+        returning an empty index if none has been saved yet.
+        """
+        file_data = {}
+
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                file_data = json.load(file)
+        except FileNotFoundError:
+            pass
+        except json.JSONDecodeError as error:
+            # Only a damaged index; the blobs it pointed to are re-indexed
+            # as they're fetched again
+            print(error)
+
+        return file_data
+
+    def index_save(self):
+        """Saves the url to digest index into the cache directory,
+        keeping entries written by other stores sharing the directory.
+
+        The index is written to a temporary file first and moved into
+        place, so readers never see a partially written index.
+        """
+        with self._lock:
+            file_data = self.index_load()
+            file_data.update(self.index)
+
+            self.safe_make_dirs(self.cache_dir)
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8",
+                                             dir=self.cache_dir,
+                                             delete=False) as file:
+                json.dump(file_data, file)
+
+            os.replace(file.name, self.index_path)
+
+    def path(self, url, timeout=10):
+        """Returns the path on disk of the asset at url,
+        fetching it first if needed, or None if unavailable.
+        """
+        digest = self.fetch(url, timeout)
+        if digest is None:
+            return None
+
+        return self.blob_path(digest)
+
+    def prefetch(self, urls, max_workers=None, timeout=10):
+        """Downloads every asset in urls that isn't stored yet, in
+        parallel over the pooled connections.
+
+        Returns a dict mapping each url to its digest (None on failure).
+        """
+        urls = list(dict.fromkeys(urls))
+        if max_workers is None:
+            max_workers = self.pool_size
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                lambda url: self._fetch(url, timeout), urls))
+
+        # Save the index once for the whole batch
+        if any(added for (_, added) in results):
+            self.index_save()
+
+        return {url: digest for (url, (digest, _)) in zip(urls, results)}
+
+    def read(self, url, use_mmap=False, timeout=10):
+        """Returns the contents of the asset at url, fetching it first
+        if needed, or None if unavailable.
+
+        By default the contents are read into bytes. With [use_mmap]
+        set, the file is mapped read-only and a memoryview over the
+        mapping is returned instead, so the bytes are never copied.
+        """
+        blob_path = self.path(url, timeout)
+        if blob_path is None:
+            return None
+
+        with open(blob_path, "rb") as file:
+            if not use_mmap:
+                return file.read()
+
+            # Empty files can't be mapped
+            if os.fstat(file.fileno()).st_size == 0:
+                return memoryview(b"")
+
+            return memoryview(mmap.mmap(file.fileno(), 0,
+                                        access=mmap.ACCESS_READ))
+
+    @staticmethod
+    def safe_make_dirs(path):
+        """Create a leaf directory and all intermediate directories safely.
+        Takes a path as either a relative or absolute directory tree
+        to create new directories.
+        """
+        try:
+            os.makedirs(path)
+        except OSError as error:
+            if error.errno != 17:
+                # File exists
+                raise
+
+        return path
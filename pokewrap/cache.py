@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+"""
+Cache backends used by the api module to store data retrieved from
+PokeAPI, so each resource only has to be downloaded once.
+
+Every backend stores entries as (data, cached_at) pairs under the url
+they were retrieved from, where cached_at is the time in epoch seconds
+the data was fetched. Backends share a small interface built around
+batches, get_many() and set_many(), with get() and set() as shortcuts
+for single entries.
+
+The default JsonFileCache keeps everything in a cache.json file.
+RedisCache shares one cache between any number of machines through a
+Redis-compatible server, and LayeredCache puts a fast local cache such
+as MemoryCache in front of a slower shared one:
+>>> cache = LayeredCache(MemoryCache(), RedisCache("cache.internal"))
+>>> pokewrap.ApiController("pokemon", "gengar", cache=cache)
+"""
+
+import json
+import socket
+import threading
+from abc import ABC, abstractmethod
+
+
+# Reserved cache file key holding the time each url was fetched
+CACHE_TIMESTAMP_KEY = "_cached_at"
+
+# Serializes cache file access between callers and background refreshes
+_CACHE_LOCK = threading.RLock()
+
+
+class CacheBackend(ABC):
+    """The interface every cache backend implements.
+    Subclasses must override get_many() and set_many().
+    """
+    def get(self, key):
+        """Returns the (data, cached_at) entry stored at key,
+        or None if there isn't one.
+        """
+        return self.get_many([key]).get(key)
+
+    @abstractmethod
+    def get_many(self, keys):
+        """Returns a dict mapping each of the given keys that has an
+        entry to its (data, cached_at) pair.
+        """
+
+    def set(self, key, data, cached_at):
+        """Stores data, fetched at cached_at, under key."""
+        self.set_many({key: (data, cached_at)})
+
+    @abstractmethod
+    def set_many(self, entries):
+        """Stores every (data, cached_at) pair in the entries dict
+        under its key.
+        """
+
+
+class JsonFileCache(CacheBackend):
+    """A cache kept in a single json file on disk, mapping each url
+    to its data, with fetch times under CACHE_TIMESTAMP_KEY.
+    """
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+
+    def __repr__(self):
+        return f"<JsonFileCache {self.cache_path}>"
+
+    def get_many(self, keys):
+        file_data = self.load()
+        timestamps = file_data.get(CACHE_TIMESTAMP_KEY, {})
+
+        return {key: (file_data[key], timestamps.get(key, 0))
+                for key in keys if key in file_data.keys()}
+
+    def load(self):
+        """Loads the whole cache file, if applicable.
+        Handles errors that could be thrown based on the possible
+        states the cache can exist in (doesn't exist, open, etc.).
+        """
+        file_data = {}
+
+        try:
+            with _CACHE_LOCK, open(self.cache_path, "r",
+                                   encoding="utf-8") as file:
+                file_data = json.load(file)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            # Check if cache file is already open
+            if error.errno == 11:
+                pass
+            else:
+                raise error
+
+        return file_data
+
+    def set_many(self, entries):
+        """Saves the entries into the cache file, unless the file
+        already holds a copy fetched more recently.
+        """
+        try:
+            with _CACHE_LOCK:
+                file_data = self.load()
+                timestamps = file_data.setdefault(CACHE_TIMESTAMP_KEY, {})
+
+                for (key, (data, cached_at)) in entries.items():
+                    if key not in file_data.keys() \
+                            or cached_at > timestamps.get(key, 0):
+                        file_data[key] = data
+                        timestamps[key] = cached_at
+
+                with open(self.cache_path, "w", encoding="utf-8") as file:
+                    file.seek(0)
+                    json.dump(file_data, file)
+        except OSError as error:
+            # Cache already open
+            if error.errno == 11:
+                raise KeyError("Cache could not be opened.") from error
+            else:
+                raise
+
+
+class MemoryCache(CacheBackend):
+    """A cache held in a dict in the running process,
+    shared between threads.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, keys):
+        with self._lock:
+            return {key: self._entries[key]
+                    for key in keys if key in self._entries}
+
+    def set_many(self, entries):
+        with self._lock:
+            for (key, (data, cached_at)) in entries.items():
+                current = self._entries.get(key)
+                if current is None or cached_at >= current[1]:
+                    self._entries[key] = (data, cached_at)
+
+
+class LayeredCache(CacheBackend):
+    """Stacks several caches, fastest first. Lookups stop at the first
+    layer holding an entry and copy it into the layers above, while
+    new entries are written to every layer.
+    """
+    def __init__(self, *layers):
+        if not layers:
+            raise ValueError("LayeredCache needs at least one layer")
+
+        self.layers = layers
+
+    def __repr__(self):
+        return f"<LayeredCache {list(self.layers)}>"
+
+    def get_many(self, keys):
+        found = {}
+        missing = list(keys)
+
+        for (depth, layer) in enumerate(self.layers):
+            if not missing:
+                break
+
+            hits = layer.get_many(missing)
+            if hits:
+                for upper in self.layers[:depth]:
+                    upper.set_many(hits)
+
+                found.update(hits)
+                missing = [key for key in missing if key not in hits]
+
+        return found
+
+    def set_many(self, entries):
+        for layer in self.layers:
+            layer.set_many(entries)
+
+
+class RedisCache(CacheBackend):
+    """A cache kept on a server speaking the Redis protocol (RESP),
+    letting many processes and machines share the same entries.
+
+    Entries are stored as json strings under [prefix] + url, expiring
+    after [expire] seconds if given. Batches are sent as pipelined
+    MGET/SET commands, [batch_size] keys at a time, so a lookup of any
+    size costs a single network round-trip.
+
+    Server errors are printed and treated as cache misses, so an
+    unreachable server only slows requests down instead of failing them.
+    """
+    def __init__(self, host="localhost", port=6379, db=0, password=None,
+                 prefix="pokewrap:", expire=None, timeout=5,
+                 batch_size=100):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self.expire = expire
+        self.timeout = timeout
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._sock = None
+        self._reader = None
+
+    def __repr__(self):
+        return f"<RedisCache {self.host}:{self.port}/{self.db}>"
+
+    def _connect(self):
+        """Opens the connection to the server, then authenticates
+        and selects the database if needed.
+        """
+        self._sock = socket.create_connection((self.host, self.port),
+                                              timeout=self.timeout)
+        self._reader = self._sock.makefile("rb")
+
+        setup = []
+        if self.password is not None:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            try:
+                self._send(setup)
+            except BaseException:
+                # Never keep a connection that isn't authenticated
+                # or is pointed at the wrong database
+                self._disconnect()
+                raise
+
+    def _disconnect(self):
+        """Closes the connection so the next command reconnects."""
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+
+        self._sock = None
+        self._reader = None
+
+    @staticmethod
+    def _encode(command):
+        """Encodes a command as a RESP array of bulk strings."""
+        parts = [f"*{len(command)}\r\n".encode()]
+
+        for arg in command:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(f"${len(arg)}\r\n".encode() + arg + b"\r\n")
+
+        return b"".join(parts)
+
+    def _read_reply(self):
+        """Reads and decodes a single RESP reply from the server."""
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by cache server")
+
+        kind, payload = line[:1], line[1:-2]
+
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            # Returned rather than raised to keep reading the pipeline
+            return RuntimeError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length == -1:
+                return None
+            return [self._read_reply() for _ in range(length)]
+
+        raise ConnectionError(f"Unexpected reply from cache server: {line}")
+
+    def _send(self, commands):
+        """Sends every command in one write, then reads
+        their replies back in order.
+        """
+        self._sock.sendall(b"".join(self._encode(c) for c in commands))
+        replies = [self._read_reply() for _ in commands]
+
+        for reply in replies:
+            if isinstance(reply, RuntimeError):
+                raise reply
+
+        return replies
+
+    def close(self):
+        """Closes the connection to the server. It gets reopened
+        automatically if the cache is used again.
+        """
+        with self._lock:
+            self._disconnect()
+
+    def execute(self, commands):
+        """Runs a pipeline of commands (tuples of arguments) and returns
+        their replies, reconnecting once if the connection dropped.
+        """
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._send(commands)
+                except (ConnectionError, socket.timeout, OSError):
+                    self._disconnect()
+                    if attempt == 2:
+                        raise
+
+        return []
+
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        batches = [keys[i:i + self.batch_size]
+                   for i in range(0, len(keys), self.batch_size)]
+        if not batches:
+            return {}
+
+        try:
+            replies = self.execute([
+                ("MGET", *(self.prefix + key for key in batch))
+                for batch in batches
+            ])
+        except (OSError, RuntimeError) as error:
+            print(error)
+            return {}
+
+        found = {}
+        for (batch, values) in zip(batches, replies):
+            for (key, value) in zip(batch, values):
+                if value is None:
+                    continue
+
+                try:
+                    entry = json.loads(value)
+                    found[key] = (entry["data"], entry["cached_at"])
+                except (ValueError, KeyError, TypeError) as error:
+                    # Not written by RedisCache, treat it as a miss
+                    print(f"Unreadable cache entry '{key}': {error!r}")
+
+        return found
+
+    def set_many(self, entries):
+        commands = []
+
+        for (key, (data, cached_at)) in entries.items():
+            value = json.dumps({"data": data, "cached_at": cached_at})
+            command = ("SET", self.prefix + key, value)
+            if self.expire is not None:
+                command += ("EX", int(self.expire))
+            commands.append(command)
+
+        if not commands:
+            return
+
+        try:
+            self.execute(commands)
+        except (OSError, RuntimeError) as error:
+            print(error)
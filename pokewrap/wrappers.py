@@ -28,47 +28,309 @@ Then access its data using dictionary keys from .content:
             "url": "https://pokeapi.co/api/v2/type/4/"
         }
     }
+
+Every other resource type has a wrapper class of its own, named after
+it, which only contacts the API once its contents are first accessed.
+Fields are available as attributes, and references to other resources
+become wrapper objects themselves:
+>>> tackle = Move("tackle")
+>>> tackle.type
+<Type 'normal'>
+>>> tackle.type.damage_relations["double_damage_to"]
+[]
+
+Sprites are downloaded once into a shared AssetStore on disk:
+>>> new_pokemon.sprite("front_default")
+b'\x89PNG...'
 """
 
-from .api import ApiController
+import copy
+import threading
+import weakref
 
+from .api import API_URI_STUB, RESOURCE_TYPES, ApiController
+from .assets import AssetStore
 
-class Pokemon:
-    """A Pokemon object that contains an APIController object
-    with data returned from a call to the PokeAPI endpoint.
+
+# Wrappers created through cross-links, reused while anything holds them
+_LINKED_RESOURCES = weakref.WeakValueDictionary()
+
+# Guards creation of the shared sprite store
+_SPRITE_STORE_LOCK = threading.Lock()
+
+
+class ApiResource:
+    """The base of every resource wrapper class. Wraps an ApiController
+    object that is only created, and its data only parsed, the first
+    time the wrapper's contents are accessed.
+
+    Fields of the returned data are available as attributes, with
+    references to other resources turned into wrappers of their own.
+
+    Keyword arguments for the ApiController, such as cache, cache_ttl
+    or serve_stale, can be set for every wrapper through the
+    controller_options class attribute, or per wrapper when creating
+    it. Per-wrapper options are passed on to the wrappers it links to.
     """
 
-    def __init__(self, name_or_id):
-        """Instantiates a new Pokemon class containing an
-        APIController container class with the information
-        retrieved from the API or cache.
+    __slots__ = ("_name_or_id", "_options", "_api_data", "_fields",
+                 "_data", "__weakref__")
+
+    # The RESOURCE_TYPES entry a subclass wraps
+    resource = None
+
+    # Default ApiController keyword arguments for every wrapper
+    controller_options = {}
+
+    def __init__(self, name_or_id, **controller_options):
+        """Instantiates a new wrapper for the resource with the given
+        name or id without contacting the API or cache yet.
+
+        Any [controller_options] are passed on to the ApiController,
+        overriding the class-wide controller_options.
         """
-        self._api_data = ApiController(
-            resource="pokemon",
-            name_or_id=name_or_id
-        )
+        self._name_or_id = name_or_id
+        self._options = controller_options or None
+        self._api_data = None
+        self._fields = None
+        self._data = None
 
-        self.id = self._api_data.id
-        self.name = self._api_data.name
-        self.url = self._api_data.url
+    def __getattr__(self, name):
+        # Only reached for names missing from the class and its slots
+        if name.startswith("_"):
+            raise AttributeError(name)
 
-        self.data = self._build_dict()
+        data = self._build_dict()
+        if name not in data:
+            raise AttributeError(f"'{type(self).__name__}' object "
+                                 f"has no attribute '{name}'")
+
+        if self._fields is None:
+            self._fields = {}
+        if name not in self._fields:
+            self._fields[name] = self._link(data[name])
+
+        return self._fields[name]
 
     def __str__(self):
         return f"{self.name}"
 
     def __repr__(self):
+        if self._api_data is None:
+            return f"<{type(self).__name__} {self._name_or_id!r}>"
+
         return f"<{self.name} #{self.id} at {self.url}>"
 
     def _build_dict(self):
         """Returns a dictionary object from further inside
         the nested dict structure returned from the API call.
+
+        The dict is shared with the ApiController rather than copied,
+        keeping repeated field access cheap, so it must not be modified.
+        """
+        # The first url retrieved is the resource itself
+        return next(iter(self._load().content_dict.values()))
+
+    def _link(self, value):
+        """Converts references to other resources inside value, which
+        look like {"name": ..., "url": ...}, into their wrapper objects
+        sharing this wrapper's controller options.
+        Dicts and lists are converted recursively.
+        """
+        if isinstance(value, list):
+            return [self._link(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        url = value.get("url")
+        if (isinstance(url, str) and url.startswith(API_URI_STUB)
+                and set(value.keys()) <= {"name", "url"}):
+            path = url[len(API_URI_STUB):].strip("/")
+            resource, _, id_ = path.partition("/")
+            if resource in RESOURCE_CLASSES:
+                return link_resource(resource, value.get("name", id_),
+                                     self._options)
+
+        return {key: self._link(item) for (key, item) in value.items()}
+
+    def _load(self):
+        """Retrieves the resource through an ApiController
+        the first time it's needed, then returns the controller.
+
+        Any failure is raised as a LookupError, since an AttributeError
+        escaping a property would send Python back into __getattr__.
+        """
+        if self._api_data is None:
+            options = {**self.controller_options, **(self._options or {})}
+            try:
+                self._api_data = ApiController(
+                    resource=self.resource,
+                    name_or_id=self._name_or_id,
+                    **options
+                )
+            except Exception as error:
+                raise LookupError(f"Could not load {self.resource} "
+                                  f"'{self._name_or_id}'") from error
+
+        return self._api_data
+
+    @property
+    def data(self):
+        """A copy of the resource's data as returned from the API or
+        cache, safe to modify without affecting the cached entry.
+
+        The copy is made on first access and kept for later ones.
+        """
+        if self._data is None:
+            self._data = copy.deepcopy(self._build_dict())
+
+        return self._data
+
+    @property
+    def id(self):
+        """The resource's id number."""
+        return self._load().id
+
+    @property
+    def name(self):
+        """The resource's name, known without a lookup
+        if the wrapper was created from it.
+        """
+        if self._api_data is None and isinstance(self._name_or_id, str) \
+                and not self._name_or_id.isdigit():
+            return self._name_or_id.lower()
+
+        return self._load().name
+
+    @property
+    def url(self):
+        """The url the resource is retrieved from."""
+        return self._load().url
+
+
+class Pokemon(ApiResource):
+    """A Pokemon object that contains an APIController object
+    with data returned from a call to the PokeAPI endpoint.
+    """
+
+    __slots__ = ()
+
+    resource = "pokemon"
+
+    # Shared by every Pokemon, created the first time a sprite is needed
+    sprite_store = None
+
+    @classmethod
+    def _get_sprite_store(cls):
+        """Returns the AssetStore sprites are saved in,
+        creating the default one on first use.
         """
-        # Specifically needs to be an indexable list (keys object is not)
-        content_keys = [key for key in self._api_data.content_dict]
+        with _SPRITE_STORE_LOCK:
+            if cls.sprite_store is None:
+                cls.sprite_store = AssetStore()
+
+        return cls.sprite_store
+
+    def prefetch_sprites(self, keys=None):
+        """Downloads the sprites named in keys (all of them by default)
+        in parallel, returning a dict of each key to its path on disk
+        (None for sprites that couldn't be downloaded).
+        """
+        urls = self.sprite_urls()
+        if keys is not None:
+            urls = {key: urls[key] for key in keys if key in urls}
+
+        store = self._get_sprite_store()
+        digests = store.prefetch(urls.values())
+
+        return {key: None if digests[url] is None
+                else store.blob_path(digests[url])
+                for (key, url) in urls.items()}
+
+    def sprite(self, key="front_default", use_mmap=False):
+        """Returns the bytes of the sprite at key, or a memoryview over
+        the file mapped into memory if use_mmap is set.
+
+        Nested sprites are addressed with '/', for example
+        'other/official-artwork/front_default'. Returns None if the
+        Pokemon has no such sprite.
+        """
+        url = self.sprite_urls().get(key)
+        if url is None:
+            return None
+
+        return self._get_sprite_store().read(url, use_mmap=use_mmap)
+
+    def sprite_path(self, key="front_default"):
+        """Returns the path on disk of the sprite at key,
+        or None if the Pokemon has no such sprite.
+        """
+        url = self.sprite_urls().get(key)
+        if url is None:
+            return None
+
+        return self._get_sprite_store().path(url)
+
+    def sprite_urls(self):
+        """Flattens the nested 'sprites' entry of the Pokemon's data
+        into a dict of '/'-joined keys to their (non-null) urls.
+        """
+        urls = {}
+        pending = [("", self._build_dict().get("sprites") or {})]
+
+        while pending:
+            prefix, sprites = pending.pop()
+            for (key, value) in sprites.items():
+                if isinstance(value, dict):
+                    pending.append((prefix + key + "/", value))
+                elif isinstance(value, str):
+                    urls[prefix + key] = value
+
+        return urls
+
+
+def _class_name(resource):
+    """Builds a class name from a resource type,
+    for example 'berry-firmness' becomes 'BerryFirmness'.
+    """
+    return "".join(part.capitalize() for part in resource.split("-"))
+
+
+def link_resource(resource, name_or_id, controller_options=None):
+    """Returns the wrapper for the given resource and name or id,
+    reusing the existing one if it is still alive so references
+    shared between resources are only ever loaded once.
+
+    Wrappers are only reused between links made with the same
+    [controller_options] dict, so each cache keeps its own wrappers.
+    """
+    key = (resource, str(name_or_id).lower(), id(controller_options))
+
+    wrapper = _LINKED_RESOURCES.get(key)
+    if wrapper is None:
+        wrapper = RESOURCE_CLASSES[resource](name_or_id,
+                                             **(controller_options or {}))
+        # Share the same dict so links made from this wrapper match
+        wrapper._options = controller_options
+        _LINKED_RESOURCES[key] = wrapper
+
+    return wrapper
+
+
+# Generate a wrapper class for every resource type, e.g. Move("tackle")
+RESOURCE_CLASSES = {Pokemon.resource: Pokemon}
+for _resource in RESOURCE_TYPES:
+    if _resource not in RESOURCE_CLASSES:
+        RESOURCE_CLASSES[_resource] = type(
+            _class_name(_resource),
+            (ApiResource,),
+            {"__doc__": f"A wrapper for a '{_resource}' resource.",
+             "__module__": __name__,
+             "__slots__": (),
+             "resource": _resource}
+        )
 
-        uri_key = content_keys[0]
-        api_content = {key: self._api_data.content_dict[uri_key][key]
-                       for key in self._api_data.content_dict[uri_key].keys()}
+globals().update({cls.__name__: cls for cls in RESOURCE_CLASSES.values()})
 
-        return api_content
+__all__ = ["ApiResource", "RESOURCE_CLASSES",
+           *(cls.__name__ for cls in RESOURCE_CLASSES.values())]
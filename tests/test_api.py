@@ -14,7 +14,13 @@ As bugs are reported, the test suite will grow more robust.
 import unittest
 import sys
 import os
+import tempfile
+import threading
 import requests
+from unittest import mock
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import StreamRequestHandler, ThreadingTCPServer
 
 # Import api_modules/api using paths to ensure directory is found
 sys.path.append(".")
@@ -107,5 +113,589 @@ class TestApi(unittest.TestCase):
         self.assertTrue(set(key_set).issuperset(set(api.RESOURCE_TYPES)))
 
 
+class TestListingSync(unittest.TestCase):
+    """Tests for ApiResourceList bringing cached listings up to date,
+    with the API replaced by a fake listing of pokemon
+    """
+
+    def setUp(self):
+        self.count = 5
+        self.urls = []
+        self.cache = api.MemoryCache()
+
+        patcher = mock.patch("pokewrap.api.requests.get",
+                             side_effect=self.fake_get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_get(self, url, timeout=10):
+        self.urls.append(url)
+
+        query = dict(part.split("=") for part in
+                     url.partition("?")[2].split("&") if part)
+        limit = int(query.get("limit", 20))
+        offset = int(query.get("offset", 0))
+
+        response = mock.Mock()
+        response.json.return_value = {
+            "count": self.count,
+            "next": None,
+            "results": [{"name": f"pokemon-{i}"} for i in
+                        range(offset, min(self.count, offset + limit))]
+        }
+        return response
+
+    def test_unchanged_listing_probed(self):
+        """Tests that an up to date listing only costs one small request
+        """
+        api.ApiResourceList("pokemon", cache=self.cache)
+        self.urls.clear()
+        listing = api.ApiResourceList("pokemon", cache=self.cache)
+
+        self.assertEqual(self.urls, [listing.endpoint + "/?limit=1"])
+        self.assertEqual(len(listing), 5)
+
+    def test_missing_tail_fetched(self):
+        """Tests that only resources added upstream get fetched
+        and appended to the cached listing
+        """
+        api.ApiResourceList("pokemon", cache=self.cache)
+        self.count = 7
+        self.urls.clear()
+        listing = api.ApiResourceList("pokemon", cache=self.cache)
+
+        self.assertEqual(self.urls[-1],
+                         listing.endpoint + "/?limit=2&offset=5")
+        self.assertEqual(len(listing), 7)
+        self.assertEqual([result["name"] for result in listing][-1],
+                         "pokemon-6")
+        self.assertEqual(len(self.cache.get(listing.endpoint)[0]["results"]),
+                         7)
+
+    def test_get_data_syncs_by_default(self):
+        """Tests that get_data follows the listing's sync setting
+        and keeps the listing's attributes in step
+        """
+        listing = api.ApiResourceList("pokemon", cache=self.cache)
+        self.count = 6
+        listing.get_data(None, None)
+        listing.cache_save()
+
+        self.assertEqual(self.urls[-1],
+                         listing.endpoint + "/?limit=1&offset=5")
+        self.assertEqual(len(listing), 6)
+        self.assertEqual(len(list(listing)), 6)
+        self.assertEqual(len(self.cache.get(listing.endpoint)[0]["results"]),
+                         6)
+
+    def test_shrunk_listing_refetched_complete(self):
+        """Tests that a complete listing stays complete when resources
+        are removed upstream, whatever paging the caller asks for
+        """
+        api.ApiResourceList("pokemon", limit=100, cache=self.cache)
+        self.count = 4
+        listing = api.ApiResourceList("pokemon", limit=2, cache=self.cache)
+
+        self.assertEqual(self.urls[-1], listing.endpoint + "/?limit=4")
+        self.assertEqual(len(list(listing)), 4)
+
+        self.count = 6
+        listing = api.ApiResourceList("pokemon", cache=self.cache)
+        self.assertEqual(len(list(listing)), 6)
+
+    def test_short_tail_counted(self):
+        """Tests that a tail missing results leaves the count at what
+        the listing holds, so the next sync fetches the rest
+        """
+        api.ApiResourceList("pokemon", cache=self.cache)
+        self.count = 8
+        real_get = self.fake_get
+
+        def short_get(url, timeout=10):
+            response = real_get(url, timeout)
+            results = response.json.return_value["results"]
+            if "offset" in url:
+                del results[-1]
+            return response
+
+        with mock.patch("pokewrap.api.requests.get", side_effect=short_get):
+            listing = api.ApiResourceList("pokemon", cache=self.cache)
+        self.assertEqual(len(listing), 7)
+
+        listing = api.ApiResourceList("pokemon", cache=self.cache)
+        self.assertEqual(len(listing), 8)
+        self.assertEqual(len(list(listing)), 8)
+
+
+class TestResourceWrappers(unittest.TestCase):
+    """Tests for the generated wrapper classes, one per resource type
+    """
+
+    def test_class_per_resource(self):
+        """Tests that every resource type has a wrapper class
+        """
+        self.assertEqual(set(api.RESOURCE_CLASSES), set(api.RESOURCE_TYPES))
+        self.assertIs(api.RESOURCE_CLASSES["pokemon"], api.Pokemon)
+        self.assertIs(api.RESOURCE_CLASSES["berry-firmness"],
+                      api.wrappers.BerryFirmness)
+
+    def test_wrappers_are_lazy(self):
+        """Tests that wrappers don't load anything until accessed
+        and keep no per-instance __dict__
+        """
+        move = api.wrappers.Move("Tackle")
+
+        self.assertEqual(move.name, "tackle")
+        self.assertIsNone(move._api_data)
+        self.assertFalse(hasattr(move, "__dict__"))
+
+    def test_links_are_shared(self):
+        """Tests that references to the same resource
+        resolve to the same wrapper object
+        """
+        link = {"name": "ghost", "url": api.API_URI_STUB + "/type/8/"}
+        move = api.wrappers.Move("tackle")
+
+        self.assertIs(move._link(link),
+                      api.wrappers.Move("lick")._link(dict(link)))
+        self.assertIsInstance(move._link([link])[0], api.wrappers.Type)
+
+    def test_links_share_controller_options(self):
+        """Tests that linked wrappers load through the same cache
+        as the wrapper linking to them
+        """
+        cache = api.MemoryCache()
+        link = {"name": "ghost", "url": api.API_URI_STUB + "/type/8/"}
+        ghost = api.wrappers.Move("lick", cache=cache)._link(link)
+
+        self.assertIs(ghost._options["cache"], cache)
+        self.assertIsNot(ghost, api.wrappers.Move("lick")._link(link))
+
+    def test_failed_load_raises(self):
+        """Tests that a resource which can't be loaded raises
+        a LookupError instead of recursing through __getattr__
+        """
+        move = api.wrappers.Move("no-such-move")
+
+        with mock.patch("pokewrap.api.requests.get",
+                        side_effect=requests.exceptions.ConnectionError), \
+                mock.patch("pokewrap.api.RESOURCE_ENDPOINTS",
+                           {api.API_URI_STUB: {"move": "move"}}):
+            with self.assertRaises(LookupError):
+                move.id
+            with self.assertRaises(LookupError):
+                move.power
+
+    def test_data_is_copy(self):
+        """Tests that modifying a wrapper's data
+        leaves the cached entry untouched
+        """
+        cache = api.MemoryCache()
+        url = "/".join((api.API_URI_STUB, "pokemon", TEST_POKEMON))
+        cache.set(url, {"name": TEST_POKEMON, "id": TEST_NUM,
+                        "types": [{"slot": 1}]}, 0)
+        pokemon = api.Pokemon(TEST_POKEMON, cache=cache)
+        pokemon.data["types"][0]["slot"] = 2
+
+        self.assertEqual(cache.get(url)[0]["types"], [{"slot": 1}])
+        self.assertIs(pokemon.data, pokemon.data)
+
+
+class TestServeStale(unittest.TestCase):
+    """Tests for ApiController returning expired cache entries,
+    with the API replaced by a fake that counts its requests
+    """
+
+    def setUp(self):
+        self.urls = []
+        self.release = threading.Event()
+        self.release.set()
+
+        self.cache = api.MemoryCache()
+        self.refresher = api.CacheRefresher(max_workers=1)
+        self.addCleanup(self.refresher.shutdown)
+
+        self.url = "/".join((api.API_URI_STUB, "pokemon", TEST_POKEMON))
+        self.cache.set(self.url, {"name": TEST_POKEMON, "id": TEST_NUM,
+                                  "version": 0}, 0)
+
+        for patcher in (
+                mock.patch("pokewrap.api.requests.get",
+                           side_effect=self.fake_get),
+                mock.patch("pokewrap.api.RESOURCE_ENDPOINTS",
+                           {api.API_URI_STUB: {"pokemon": self.url}})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fake_get(self, url, timeout=10):
+        self.release.wait(timeout=5)
+        self.urls.append(url)
+
+        response = mock.Mock()
+        response.json.return_value = {"name": TEST_POKEMON, "id": TEST_NUM,
+                                      "version": len(self.urls)}
+        return response
+
+    def controller(self, **kwargs):
+        return api.ApiController("pokemon", TEST_POKEMON, cache=self.cache,
+                                 refresher=self.refresher, cache_ttl=60,
+                                 **kwargs)
+
+    def test_stale_served_then_refreshed(self):
+        """Tests that an expired entry is returned without waiting
+        on the API while a refresh updates the cache
+        """
+        self.release.clear()
+        controller = self.controller(serve_stale=True)
+
+        self.assertEqual(controller.content_dict[self.url]["version"], 0)
+        self.assertEqual(len(self.refresher), 1)
+
+        self.release.set()
+        self.refresher.wait(timeout=5)
+
+        self.assertEqual(self.urls, [self.url])
+        self.assertEqual(self.cache.get(self.url)[0]["version"], 1)
+
+    def test_stale_served_after_shutdown(self):
+        """Tests that a shut down refresher doesn't keep
+        the stale copy from being returned
+        """
+        self.refresher.shutdown()
+        controller = self.controller(serve_stale=True)
+
+        self.assertEqual(controller.get_data()[self.url]["version"], 0)
+        self.assertEqual(self.urls, [])
+
+    def test_expired_refetched(self):
+        """Tests that an expired entry is fetched again before
+        returning when stale entries aren't served
+        """
+        controller = self.controller()
+
+        self.assertEqual(controller.get_data()[self.url]["version"], 1)
+        self.assertEqual(self.cache.get(self.url)[0]["version"], 1)
+        self.assertEqual(len(self.refresher), 0)
+
+    def test_stale_used_when_api_down(self):
+        """Tests that the expired entry is returned
+        when the API can't be reached
+        """
+        with mock.patch("pokewrap.api.requests.get",
+                        side_effect=requests.exceptions.ConnectionError):
+            controller = self.controller()
+            data = controller.get_data()
+
+        self.assertEqual(data[self.url]["version"], 0)
+        self.assertEqual(controller.id, TEST_NUM)
+
+
+class TestCacheRefresher(unittest.TestCase):
+    """Tests for the background worker that refreshes expired
+    cache entries in serve-stale mode
+    """
+
+    def test_refresh_deduplicated(self):
+        """Tests that a url with a refresh already pending
+        doesn't get queued a second time
+        """
+        refresher = api.CacheRefresher(max_workers=1)
+        release = threading.Event()
+        calls = []
+
+        def refresh(url):
+            release.wait(timeout=5)
+            calls.append(url)
+
+        first = refresher.submit(TEST_POKEMON, refresh)
+        second = refresher.submit(TEST_POKEMON, refresh)
+        release.set()
+        refresher.shutdown()
+
+        self.assertIs(first, second)
+        self.assertEqual(calls, [TEST_POKEMON])
+        self.assertEqual(len(refresher), 0)
+
+    def test_refresh_scoped_per_cache(self):
+        """Tests that the same url is refreshed separately
+        for each cache it's stale in
+        """
+        refresher = api.CacheRefresher(max_workers=1)
+        release = threading.Event()
+
+        first = refresher.submit(TEST_POKEMON, lambda url: release.wait(5),
+                                 scope=api.MemoryCache())
+        second = refresher.submit(TEST_POKEMON, lambda url: None,
+                                  scope=api.MemoryCache())
+        release.set()
+        refresher.shutdown()
+
+        self.assertIsNot(first, second)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """Serves files for the asset tests without logging each request
+    """
+
+    def do_GET(self):
+        # Promises more bytes than it sends, like a dropped connection
+        if self.path == "/truncated.png":
+            self.send_response(200)
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            self.wfile.write(b"partial")
+            self.close_connection = True
+            return
+
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestAssetStore(unittest.TestCase):
+    """Tests for the content-addressed asset store backing sprites,
+    served from a local http server
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        serve_dir = os.path.join(self.tmp_dir.name, "serve")
+        os.makedirs(serve_dir)
+
+        for name in ("front.png", "copy.png"):
+            with open(os.path.join(serve_dir, name), "wb") as file:
+                file.write(b"sprite bytes")
+
+        handler = partial(QuietHandler, directory=serve_dir)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/"
+        self.store = api.AssetStore(os.path.join(self.tmp_dir.name, "assets"))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_identical_assets_share_blob(self):
+        """Tests that identical contents at different urls
+        are stored once under the same digest
+        """
+        digests = self.store.prefetch([self.base_url + "front.png",
+                                       self.base_url + "copy.png"])
+
+        self.assertEqual(len(set(digests.values())), 1)
+        self.assertEqual(self.store.read(self.base_url + "front.png"),
+                         b"sprite bytes")
+
+    def test_failed_download_cleaned_up(self):
+        """Tests that a download cut short leaves
+        no temporary file behind
+        """
+        self.assertIsNone(self.store.fetch(self.base_url + "truncated.png"))
+        self.assertEqual(os.listdir(self.store.cache_dir), [])
+
+    def test_prefetch_saves_index_once(self):
+        """Tests that a batch prefetch writes the index a single time
+        recording every downloaded digest
+        """
+        urls = [self.base_url + "front.png", self.base_url + "copy.png"]
+
+        with mock.patch.object(self.store, "index_save",
+                               wraps=self.store.index_save) as index_save:
+            digests = self.store.prefetch(urls)
+
+        self.assertEqual(index_save.call_count, 1)
+        self.assertEqual(api.AssetStore(self.store.cache_dir).index, digests)
+
+    def test_mmap_read(self):
+        """Tests that mapped reads return a view of the stored bytes
+        """
+        view = self.store.read(self.base_url + "front.png", use_mmap=True)
+        self.assertEqual(bytes(view), b"sprite bytes")
+
+
+class StandInRedisHandler(StreamRequestHandler):
+    """Answers the few Redis commands RedisCache sends, keeping
+    values in the server's store dict
+    """
+
+    def read_command(self):
+        header = self.rfile.readline()
+        if not header:
+            return None
+
+        command = []
+        for _ in range(int(header[1:])):
+            length = int(self.rfile.readline()[1:])
+            command.append(self.rfile.read(length + 2)[:-2])
+
+        return command
+
+    def handle(self):
+        store = self.server.store
+
+        while True:
+            command = self.read_command()
+            if command is None:
+                break
+
+            name = command[0].upper()
+            self.server.commands.append(name)
+
+            if name == b"AUTH":
+                if command[1] == self.server.password:
+                    reply = b"+OK\r\n"
+                else:
+                    reply = b"-WRONGPASS invalid password\r\n"
+            elif name == b"MGET":
+                values = [store.get(key) for key in command[1:]]
+                reply = f"*{len(values)}\r\n".encode() + b"".join(
+                    b"$-1\r\n" if value is None
+                    else f"${len(value)}\r\n".encode() + value + b"\r\n"
+                    for value in values)
+            elif name == b"SET":
+                store[command[1]] = command[2]
+                reply = b"+OK\r\n"
+            else:
+                reply = b"-ERR unknown command\r\n"
+
+            self.wfile.write(reply)
+
+
+class TestRedisCache(unittest.TestCase):
+    """Tests for the shared cache backend, run against
+    a local stand-in for a Redis server
+    """
+
+    def setUp(self):
+        self.server = ThreadingTCPServer(("127.0.0.1", 0),
+                                         StandInRedisHandler)
+        self.server.daemon_threads = True
+        self.server.store = {}
+        self.server.commands = []
+        self.server.password = b"secret"
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+        port = self.server.server_address[1]
+        self.cache = api.RedisCache("127.0.0.1", port)
+
+    def tearDown(self):
+        self.cache.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_round_trip(self):
+        """Tests that entries come back as they were stored,
+        with misses left out
+        """
+        self.cache.set_many({"a": ({"name": "gengar"}, 1.5), "b": ([], 2)})
+        found = self.cache.get_many(["a", "b", "missing"])
+
+        self.assertEqual(found, {"a": ({"name": "gengar"}, 1.5),
+                                 "b": ([], 2)})
+
+    def test_unreadable_entries_missed(self):
+        """Tests that values not written by RedisCache
+        are treated as cache misses
+        """
+        self.cache.set("a", {"id": 94}, 1)
+        self.server.store[b"pokewrap:b"] = b"not json"
+        self.server.store[b"pokewrap:c"] = b'{"other": "client"}'
+
+        self.assertEqual(self.cache.get_many(["a", "b", "c"]),
+                         {"a": ({"id": 94}, 1)})
+
+    def test_batches_pipelined(self):
+        """Tests that large lookups are split into
+        MGET batches sent together
+        """
+        self.cache.batch_size = 2
+        self.cache.get_many(["a", "b", "c", "d", "e"])
+
+        self.assertEqual(self.server.commands, [b"MGET"] * 3)
+
+    def test_failed_auth_reconnects(self):
+        """Tests that a connection whose AUTH failed is dropped,
+        so the next command authenticates again
+        """
+        self.cache.password = "wrong"
+
+        self.assertEqual(self.cache.get_many(["a"]), {})
+        self.assertEqual(self.cache.get_many(["a"]), {})
+        self.assertEqual(self.server.commands, [b"AUTH", b"AUTH"])
+
+        self.cache.password = "secret"
+        self.cache.get_many(["a"])
+        self.assertEqual(self.server.commands[-2:], [b"AUTH", b"MGET"])
+
+    def test_backend_must_implement_interface(self):
+        """Tests that a backend missing part of the interface
+        can't be created
+        """
+        class PartialCache(api.CacheBackend):
+            def get_many(self, keys):
+                return {}
+
+        with self.assertRaises(TypeError):
+            PartialCache()
+
+    def test_controller_uses_shared_cache(self):
+        """Tests that controllers and listings read and write through
+        a memory cache layered over the shared one
+        """
+        urls = []
+
+        def fake_get(url, timeout=10):
+            urls.append(url)
+            response = mock.Mock()
+            response.json.return_value = {"name": TEST_POKEMON,
+                                          "id": TEST_NUM, "count": 0,
+                                          "results": []}
+            return response
+
+        def layered():
+            return api.LayeredCache(api.MemoryCache(), self.cache)
+
+        stub = "/".join((api.API_URI_STUB, "pokemon"))
+
+        with mock.patch("pokewrap.api.requests.get", side_effect=fake_get), \
+                mock.patch("pokewrap.api.RESOURCE_ENDPOINTS",
+                           {api.API_URI_STUB: {"pokemon": stub}}):
+            api.ApiController("pokemon", TEST_POKEMON, cache=layered())
+            api.ApiResourceList("pokemon", cache=layered(), sync=False)
+            self.assertEqual(len(urls), 2)
+
+            # A second node finds everything in the shared cache
+            controller = api.ApiController("pokemon", TEST_POKEMON,
+                                           cache=layered())
+            api.ApiResourceList("pokemon", cache=layered(), sync=False)
+            self.assertEqual(len(urls), 2)
+
+            self.server.commands.clear()
+            data = controller.get_data_many([stub + "/a", stub + "/b",
+                                             controller.url])
+
+        self.assertEqual(list(data), [stub + "/a", stub + "/b",
+                                      controller.url])
+        self.assertEqual(self.server.commands.count(b"MGET"), 1)
+        self.assertEqual(len(urls), 4)
+
+    def test_layered_fills_memory(self):
+        """Tests that hits from the shared cache are copied
+        into the in-process cache in front of it
+        """
+        memory = api.MemoryCache()
+        layered = api.LayeredCache(memory, self.cache)
+        self.cache.set("a", {"id": 94}, 1)
+
+        self.assertEqual(layered.get("a"), ({"id": 94}, 1))
+        self.assertEqual(memory.get("a"), ({"id": 94}, 1))
+
+
 if __name__ == "__main__":
     unittest.main()